@@ -166,6 +166,38 @@ def print_ui(events, processes, fails, flipstat=None):
     sys.stdout.flush()
 
 
+CHECKSUM_BUFSIZE = 128 * 1024
+
+
+def sha1_digest(file):
+    """
+    Compute the sha1 hex digest of a file.
+
+    Use ``hashlib.file_digest`` when it is available (python >= 3.11),
+    otherwise the file is read in fixed size chunks into a single reusable
+    buffer so large archives are never held in memory all at once.
+
+    :param file: The path to the file to hash
+    :type file: str
+
+    :return: The hex digest of the file's contents
+    :rtype: str
+    """
+    if hasattr(hashlib, "file_digest"):
+        with open(file, "rb") as fp:
+            return hashlib.file_digest(fp, "sha1").hexdigest()
+    digest = hashlib.sha1()
+    buf = bytearray(CHECKSUM_BUFSIZE)
+    view = memoryview(buf)
+    with open(file, "rb", buffering=0) as fp:
+        while True:
+            size = fp.readinto(buf)
+            if not size:
+                break
+            digest.update(view[:size])
+    return digest.hexdigest()
+
+
 def verify_checksum(file, checksum):
     """
     Verify the checksum of a files.
@@ -183,12 +215,11 @@ def verify_checksum(file, checksum):
     if checksum is None:
         log.error("Can't verify checksum because none was given")
         return False
-    with open(file, "rb") as fp:
-        file_checksum = hashlib.sha1(fp.read()).hexdigest()
-        if checksum != file_checksum:
-            raise RelenvException(
-                f"sha1 checksum verification failed. expected={checksum} found={file_checksum}"
-            )
+    file_checksum = sha1_digest(file)
+    if checksum != file_checksum:
+        raise RelenvException(
+            f"sha1 checksum verification failed. expected={checksum} found={file_checksum}"
+        )
     return True
 
 
@@ -375,13 +406,17 @@ def github_version(href):
         return href.split("/v")[-1]
 
 
+KRB_VERSION_RE = re.compile(r"\d\.\d\d/")
+PYTHON_VERSION_RE = re.compile(r"(\d+\.)+\d/")
+
+
 def krb_version(href):
-    if re.match(r"\d\.\d\d/", href):
+    if KRB_VERSION_RE.match(href):
         return href[:-1]
 
 
 def python_version(href):
-    if re.match(r"(\d+\.)+\d/", href):
+    if PYTHON_VERSION_RE.match(href):
         return href[:-1]
 
 
@@ -390,17 +425,34 @@ def uuid_version(href):
         return href[:-16].rsplit("/")[-1].replace("libuuid-", "")
 
 
-def parse_links(text):
-    class HrefParser(HTMLParser):
-        hrefs = []
+class HrefParser(HTMLParser):
+    """
+    Collect anchor hrefs, optionally mapping each one through ``func``.
 
-        def handle_starttag(self, tag, attrs):
-            if tag == "a":
-                link = dict(attrs).get("href", "")
-                if link:
-                    self.hrefs.append(link)
+    When ``func`` is given only its truthy results are kept, so links and
+    their versions are extracted in the same pass over the document.
+    """
 
-    parser = HrefParser()
+    def __init__(self, func=None):
+        super().__init__()
+        self.func = func
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "a":
+            return
+        link = dict(attrs).get("href", "")
+        if not link:
+            return
+        if self.func is not None:
+            link = self.func(link)
+            if not link:
+                return
+        self.hrefs.append(link)
+
+
+def parse_links(text, func=None):
+    parser = HrefParser(func)
     parser.feed(text)
     return parser.hrefs
 
@@ -418,16 +470,14 @@ def check_files(name, location, func, current):
         loose = True
 
     versions = []
-    for _ in parse_links(text):
-        version = func(_)
-        if version:
-            if loose:
-                versions.append(LooseVersion(version))
-            else:
-                try:
-                    versions.append(parse(version))
-                except InvalidVersion:
-                    pass
+    for version in parse_links(text, func):
+        if loose:
+            versions.append(LooseVersion(version))
+        else:
+            try:
+                versions.append(parse(version))
+            except InvalidVersion:
+                pass
 
     versions.sort()
     compare_versions(name, current, versions)
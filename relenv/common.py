@@ -546,14 +546,19 @@ def sanitize_sys_path(sys_path_entries):
         }
     )
     for __path in sys_path_entries:
+        # Resolve each entry once, not once per prefix.
+        try:
+            __resolved_path = pathlib.Path(__path).resolve()
+        except ValueError:
+            continue
         for __valid_path_prefix in __valid_path_prefixes:
             try:
-                __resolved_path = pathlib.Path(__path).resolve()
                 __resolved_path.relative_to(__valid_path_prefix)
-                __sys_path.append(str(__resolved_path))
             except ValueError:
                 continue
+            __sys_path.append(str(__resolved_path))
+            break
     if "PYTHONPATH" in os.environ:
-        for __path in os.environ["PYTHONPATH"].split(os.pathsep):
-            __sys_path.append(__path)
-    return __sys_path
+        __sys_path.extend(os.environ["PYTHONPATH"].split(os.pathsep))
+    # Drop duplicate entries keeping the first occurrence's position.
+    return list(dict.fromkeys(__sys_path))
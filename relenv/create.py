@@ -121,7 +121,7 @@ def create(name, dest=None, arch=None, version=None):
             f"Error, build archive for {arch} doesn't exist: {tar}\n"
             "You might try relenv fetch to resolve this."
         )
-    with tarfile.open(tar, "r:xz") as fp:
+    with tarfile.open(tar, "r:*") as fp:
         for f in fp:
             fp.extract(f, writeto)
 
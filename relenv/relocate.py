@@ -5,13 +5,26 @@ A script to ensure the proper rpaths are in place for the relenv environment.
 """
 
 import logging
+import mmap
 import os
 import pathlib
+import re
 import shutil
+import struct
 import subprocess
 
 log = logging.getLogger(__name__)
 
+# Memoized rpaths keyed by real path, see ``parse_rpath``.
+_RPATH_CACHE = {}
+
+# The absolute path of patchelf, see ``patchelf_path``.
+_PATCHELF = None
+
+# Matches the "<name> => <location> (<address>)" lines of ldd's output, the
+# address is optional and is not part of the location.
+_LDD_RE = re.compile(r"^\s*(\S+)\s*=>\s*(.*?)(?:\s+\(0x[0-9a-fA-F]+\))?\s*$", re.M)
+
 
 LIBCLIBS = [
     "linux-vdso.so.1",
@@ -46,6 +59,59 @@ LC_ID_DYLIB = "LC_ID_DYLIB"
 LC_LOAD_DYLIB = "LC_LOAD_DYLIB"
 LC_RPATH = "LC_RPATH"
 
+# Number of files given to a single readelf invocation, keeps the command
+# line well below ARG_MAX.
+READELF_BATCH_SIZE = 256
+
+ELF_MAGIC = b"\x7f\x45\x4c\x46"
+
+# ELF program header and dynamic section constants, see elf(5).
+PT_LOAD = 1
+PT_DYNAMIC = 2
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_RPATH = 15
+DT_RUNPATH = 29
+
+# Struct layouts of the ELF header (after e_ident), program headers and
+# dynamic entries keyed by EI_CLASS. The indices pick p_type, p_offset,
+# p_vaddr and p_filesz out of a program header, their order differs between
+# 32 and 64 bit files.
+ELF_LAYOUTS = {
+    1: ("HHIIIIIHHHHHH", "IIIIIIII", (0, 1, 2, 4), "iI"),
+    2: ("HHIQQQIHHHHHH", "IIQQQQQQ", (0, 2, 3, 5), "qQ"),
+}
+# Struct byte order keyed by EI_DATA.
+ELF_BYTE_ORDERS = {1: "<", 2: ">"}
+# Thin Mach-O files, 64 and 32 bit in either byte order. The fat (universal)
+# magic 0xcafebabe is left out as Java class files start with it too.
+MACHO_MAGIC = frozenset(
+    [
+        b"\xcf\xfa\xed\xfe",
+        b"\xce\xfa\xed\xfe",
+        b"\xfe\xed\xfa\xcf",
+        b"\xfe\xed\xfa\xce",
+    ]
+)
+
+
+def read_magic(path):
+    """
+    Read the first four bytes of a file.
+
+    :param path: The path to the file to read
+    :type path: str
+
+    :return: The file's magic bytes
+    :rtype: bytes
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        return os.read(fd, 4)
+    finally:
+        os.close(fd)
+
 
 def is_macho(path):
     """
@@ -57,10 +123,7 @@ def is_macho(path):
     :return: Whether the file is a macho file
     :rtype: bool
     """
-    with open(path, "rb") as fp:
-        magic = fp.read(4)
-    # XXX: Handle 64bit, 32bit, ppc, arm
-    return magic in [b"\xcf\xfa\xed\xfe"]
+    return read_magic(path) in MACHO_MAGIC
 
 
 def is_elf(path):
@@ -73,9 +136,7 @@ def is_elf(path):
     :return: Whether the file is an ELF file
     :rtype: bool
     """
-    with open(path, "rb") as fp:
-        magic = fp.read(4)
-    return magic == b"\x7f\x45\x4c\x46"
+    return read_magic(path) == ELF_MAGIC
 
 
 def parse_otool_l(stdout):
@@ -133,12 +194,48 @@ def parse_readelf_d(stdout):
     :return: The RPATH values
     :rtype: list
     """
+    # Find either RPATH or RUNPATH, only the matching line is sliced out of
+    # the output.
+    idx = stdout.find("PATH)")
+    if idx == -1:
+        return []
+    end = stdout.find("\n", idx)
+    if end == -1:
+        end = len(stdout)
+    start = stdout.find("[", idx, end) + 1
+    stop = stdout.rfind("]", start, end)
+    if not start or stop == -1:
+        return []
+    return stdout[start:stop].split(":")
+
+
+def split_readelf_files(stdout):
+    """
+    Split the output of ``readelf -d <path> <path> ...`` by file.
+
+    When given more than one file readelf prints a ``File: <path>`` banner
+    before the output for each file.
+
+    :param stdout: The output of the ``readelf -d`` command
+    :type stdout: str
+
+    :return: The output of ``readelf`` keyed by the file it describes
+    :rtype: dict
+    """
+    sections = {}
+    path = None
+    lines = []
     for line in stdout.splitlines():
-        # Find either RPATH or READPATH
-        if line.find("PATH") == -1:
-            continue
-        return line.split(":", 1)[-1].strip().strip("[").strip("]").split(":")
-    return []
+        if line.startswith("File: "):
+            if path is not None:
+                sections[path] = "\n".join(lines)
+            path = line.split(": ", 1)[1]
+            lines = []
+        elif path is not None:
+            lines.append(line)
+    if path is not None:
+        sections[path] = "\n".join(lines)
+    return sections
 
 
 def parse_macho(path):
@@ -160,9 +257,246 @@ def parse_macho(path):
     return parse_otool_l(stdout)
 
 
+def read_elf_dynamic(data):
+    """
+    Read the dynamic section of an ELF image.
+
+    The dynamic section is found through the program headers and the string
+    table address is mapped back to a file offset with the ``PT_LOAD``
+    segments, no section headers are needed.
+
+    :param data: The contents of the ELF file
+    :type data: bytes or mmap.mmap
+
+    :raises ValueError: If the data is not an ELF image that can be parsed
+
+    :return: The ``(tag, value, offset)`` of each dynamic entry and the file
+             offset of the string table, or None if there is no string table
+    :rtype: tuple
+    """
+    if len(data) < 16 or data[:4] != ELF_MAGIC:
+        raise ValueError("Not an ELF file")
+    try:
+        hdr_fmt, phdr_fmt, phdr_idx, dyn_fmt = ELF_LAYOUTS[data[4]]
+        order = ELF_BYTE_ORDERS[data[5]]
+    except KeyError:
+        raise ValueError("Unsupported ELF class or byte order")
+    phdr = struct.Struct(order + phdr_fmt)
+    dyn = struct.Struct(order + dyn_fmt)
+    entries = []
+    strtab = None
+    try:
+        hdr = struct.unpack_from(order + hdr_fmt, data, 16)
+        phoff, phentsize, phnum = hdr[4], hdr[8], hdr[9]
+        loads = []
+        dynamic = None
+        for idx in range(phnum):
+            fields = phdr.unpack_from(data, phoff + idx * phentsize)
+            p_type, p_offset, p_vaddr, p_filesz = (fields[i] for i in phdr_idx)
+            if p_type == PT_LOAD:
+                loads.append((p_vaddr, p_offset, p_filesz))
+            elif p_type == PT_DYNAMIC:
+                dynamic = (p_offset, p_filesz)
+        if dynamic is None:
+            return entries, strtab
+        offset, size = dynamic
+        for pos in range(offset, offset + size, dyn.size):
+            tag, value = dyn.unpack_from(data, pos)
+            if tag == DT_NULL:
+                break
+            if tag == DT_STRTAB:
+                strtab = value
+            entries.append((tag, value, pos))
+    except struct.error as exc:
+        raise ValueError("Truncated ELF file: {}".format(exc))
+    if strtab is None:
+        return entries, strtab
+    for vaddr, offset, filesz in loads:
+        if vaddr <= strtab < vaddr + filesz:
+            return entries, strtab - vaddr + offset
+    raise ValueError("DT_STRTAB is not in a PT_LOAD segment")
+
+
+def find_elf_string(data, strtab, value):
+    """
+    Locate a string in an ELF image's dynamic string table.
+
+    :param data: The contents of the ELF file
+    :type data: bytes or mmap.mmap
+    :param strtab: The file offset of the string table
+    :type strtab: int
+    :param value: The offset of the string within the string table
+    :type value: int
+
+    :raises ValueError: If there is no string table or the string is not terminated
+
+    :return: The start and end offsets of the string
+    :rtype: tuple
+    """
+    if strtab is None:
+        raise ValueError("No DT_STRTAB entry")
+    start = strtab + value
+    end = data.find(b"\x00", start)
+    if end == -1:
+        raise ValueError("Unterminated string")
+    return start, end
+
+
+def find_elf_rpath(data):
+    """
+    Locate the RPATH or RUNPATH string of an ELF image.
+
+    :param data: The contents of the ELF file
+    :type data: bytes or mmap.mmap
+
+    :raises ValueError: If the data is not an ELF image that can be parsed
+
+    :return: The start and end offsets of the string, or None if there is no
+             rpath
+    :rtype: tuple or None
+    """
+    entries, strtab = read_elf_dynamic(data)
+    for tag, value, _ in entries:
+        if tag in (DT_RPATH, DT_RUNPATH):
+            return find_elf_string(data, strtab, value)
+    return None
+
+
+def parse_rpath_elf(path):
+    """
+    Read the RPATH of an ELF file in process.
+
+    The file is mapped into memory and only the headers and dynamic section
+    are read.
+
+    :param path: The path to the file
+    :type path: str
+
+    :return: The RPATH's found, or None if the file could not be parsed
+    :rtype: list or None
+    """
+    with open(path, "rb") as fp:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can not be mapped
+            return None
+    with data:
+        try:
+            slot = find_elf_rpath(data)
+        except ValueError:
+            return None
+        if slot is None:
+            return []
+        start, end = slot
+        return data[start:end].decode().split(":")
+
+
+def parse_needed_elf(path):
+    """
+    Read the libraries an ELF file links against (``DT_NEEDED``) in process.
+
+    :param path: The path to the file
+    :type path: str
+
+    :return: The library names, or None if the file could not be parsed
+    :rtype: list or None
+    """
+    with open(path, "rb") as fp:
+        try:
+            data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files can not be mapped
+            return None
+    with data:
+        try:
+            entries, strtab = read_elf_dynamic(data)
+            slots = [
+                find_elf_string(data, strtab, value)
+                for tag, value, _ in entries
+                if tag == DT_NEEDED
+            ]
+        except ValueError:
+            return None
+        return [data[start:end].decode() for start, end in slots]
+
+
+def parse_rpaths(paths):
+    """
+    Return the parsed RPATHs of many ELF files.
+
+    Files are parsed in process with ``parse_rpath_elf``. Files it can not
+    parse are passed to ``readelf -d`` in batches of ``READELF_BATCH_SIZE``
+    so only one process is started per batch instead of one per file.
+
+    :param paths: The paths to the files
+    :type paths: list
+
+    :return: The RPATH's found, keyed by path
+    :rtype: dict
+    """
+    rpaths = {}
+    remaining = []
+    for path in paths:
+        path = os.fspath(path)
+        rpath = parse_rpath_elf(path)
+        if rpath is None:
+            remaining.append(path)
+        else:
+            rpaths[path] = rpath
+    for idx in range(0, len(remaining), READELF_BATCH_SIZE):
+        end = idx + READELF_BATCH_SIZE
+        batch = remaining[idx:end]
+        proc = subprocess.run(
+            ["readelf", "-d"] + batch, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        stdout = proc.stdout.decode()
+        if len(batch) == 1:
+            # No File: banner is printed for a single file.
+            rpaths[batch[0]] = parse_readelf_d(stdout)
+            continue
+        sections = split_readelf_files(stdout)
+        for path in batch:
+            rpaths[path] = parse_readelf_d(sections.get(path, ""))
+    return rpaths
+
+
+def file_stamp(path):
+    """
+    Return the key and stamp memoized results for a file are stored under.
+
+    :param path: The path to the file
+    :type path: str
+
+    :return: The file's real path and its modification time and size
+    :rtype: tuple
+    """
+    stat = os.stat(path)
+    return os.path.realpath(path), (stat.st_mtime_ns, stat.st_size)
+
+
+def cache_rpaths(paths):
+    """
+    Parse the RPATHs of many files at once and memoize them for ``parse_rpath``.
+
+    Files ``parse_rpath_elf`` can not read are handed to ``readelf`` in
+    batches rather than with one process per file.
+
+    :param paths: The paths to the files
+    :type paths: list
+    """
+    stamps = {os.fspath(path): file_stamp(path) for path in paths}
+    for path, rpath in parse_rpaths(list(stamps)).items():
+        key, stamp = stamps[path]
+        _RPATH_CACHE[key] = (stamp, rpath)
+
+
 def parse_rpath(path):
     """
-    Run ``readelf -d <path>`` and return its parsed output.
+    Return the parsed RPATH of an ELF file.
+
+    The result is memoized per file and reused for as long as the file's
+    modification time and size are unchanged.
 
     :param path: The path to the file
     :type path: str
@@ -170,10 +504,13 @@ def parse_rpath(path):
     :return: The RPATH's found.
     :rtype: list
     """
-    proc = subprocess.run(
-        ["readelf", "-d", path], stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
-    return parse_readelf_d(proc.stdout.decode())
+    key, stamp = file_stamp(path)
+    cached = _RPATH_CACHE.get(key)
+    if cached is not None and cached[0] == stamp:
+        return list(cached[1])
+    rpath = parse_rpaths([path])[os.fspath(path)]
+    _RPATH_CACHE[key] = (stamp, rpath)
+    return list(rpath)
 
 
 def handle_macho(path, root_dir, rpath_only):
@@ -181,14 +518,16 @@ def handle_macho(path, root_dir, rpath_only):
     Ensure the given macho file has the correct rpath and is in th correct location.
 
     :param path: The path to a macho file
-    :type path: str
+    :type path: str or os.PathLike
     :param root_dir: The directory the file needs to reside under
-    :type root_dir: str
+    :type root_dir: str or os.PathLike
     :param rpath_only: If true, only ensure the correct rpaths are present and don't copy the file
     :type rpath_only: bool
 
     :return: The information from ``parse_macho`` on the macho file.
     """
+    path = os.fsdecode(path)
+    root_dir = os.fsdecode(root_dir)
     obj = parse_macho(path)
     log.info("Processing file %s %r", path, obj)
     if LC_LOAD_DYLIB in obj:
@@ -231,6 +570,53 @@ def is_in_dir(filepath, directory):
     return os.path.realpath(filepath).startswith(os.path.realpath(directory) + os.sep)
 
 
+def patchelf_path():
+    """
+    Return the absolute path of ``patchelf``, looked up once per process.
+
+    :return: The path to patchelf, or ``patchelf`` when it is not on the PATH
+    :rtype: str
+    """
+    global _PATCHELF
+    if _PATCHELF is None:
+        _PATCHELF = shutil.which("patchelf")
+    return _PATCHELF or "patchelf"
+
+
+def patchelf_batch(path, ops):
+    """
+    Apply several edits to an ELF file with a single ``patchelf`` call.
+
+    Every rewrite by ``patchelf`` can grow the file, so edits to the same
+    file should be collected and applied together.
+
+    :param path: The path to an ELF file
+    :type path: str
+    :param ops: The options to pass, e.g. ``[("--set-rpath", "$ORIGIN")]``
+    :type ops: list
+
+    :return: Whether patchelf succeeded
+    :rtype: bool
+    """
+    cmd = [patchelf_path()]
+    for op in ops:
+        cmd.extend(op)
+    cmd.append(path)
+    # Not closing inherited descriptors, along with an absolute executable
+    # path, lets subprocess use posix_spawn instead of fork and exec where
+    # the platform supports it.
+    proc = subprocess.run(
+        cmd,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        close_fds=False,
+    )
+    if proc.returncode:
+        log.debug("patchelf failed on %s: %s", path, proc.stderr.decode())
+    return not proc.returncode
+
+
 def patch_rpath(path, new_rpath, only_relative=True):
     """
     Patch the rpath of a given ELF file.
@@ -254,47 +640,116 @@ def patch_rpath(path, new_rpath, only_relative=True):
     if new_rpath not in old_rpath:
         patched_rpath = ":".join([new_rpath] + old_rpath)
         log.info("Set RPATH=%s %s", patched_rpath, path)
-        proc = subprocess.run(
-            ["patchelf", "--force-rpath", "--set-rpath", patched_rpath, path],
-            stderr=subprocess.PIPE,
-            stdout=subprocess.PIPE,
+        patched = patchelf_batch(
+            path, [("--force-rpath",), ("--set-rpath", patched_rpath)]
         )
-
-        if proc.returncode:
+        # The rewrite may land within the same mtime tick, drop the memoized
+        # rpath once the file has been written.
+        _RPATH_CACHE.pop(os.path.realpath(path), None)
+        if not patched:
             return False
         return patched_rpath
     return ":".join(old_rpath)
 
 
-def handle_elf(path, libs, rpath_only, root=None):
+def index_libs(libs):
+    """
+    List the names of the libraries in the libs directory.
+
+    :param libs: The libs directory
+    :type libs: str
+
+    :return: The file names found in the directory
+    :rtype: set
+    """
+    try:
+        with os.scandir(libs) as it:
+            return {entry.name for entry in it if entry.is_file()}
+    except FileNotFoundError:
+        return set()
+
+
+def resolve_needed(needed, libs, libs_index):
+    """
+    Resolve the libraries an ELF file links against without running ``ldd``.
+
+    Only glibc libraries and libraries already in the libs directory can be
+    resolved this way, anything else needs the dynamic linker's search.
+
+    :param needed: The libraries the ELF file links against, see ``parse_needed_elf``
+    :type needed: list
+    :param libs: The libs directory
+    :type libs: str
+    :param libs_index: The names of the libraries in the libs directory
+    :type libs_index: set
+
+    :return: The name and location of each library like ``ldd`` reports
+             them, or None if a library could not be resolved
+    :rtype: list or None
+    """
+    linked = []
+    for lib_name in needed:
+        if lib_name in LIBCLIBS:
+            continue
+        if lib_name not in libs_index:
+            return None
+        linked.append((lib_name, os.path.join(libs, lib_name)))
+    return linked
+
+
+def handle_elf(path, libs, rpath_only, root=None, libs_index=None):
     """
     Handle the parsing and pathcing of an ELF file.
 
     :param path: The path of the ELF file
-    :type path: str
+    :type path: str or os.PathLike
     :param libs: The libs directory
-    :type libs: str
+    :type libs: str or os.PathLike
     :param rpath_only: If true, only ensure the correct rpaths are present and don't copy the file
     :type rpath_only: bool
     :param root: The directory to ensure the file is under, defaults to None
-    :type root: str, optional
+    :type root: str or os.PathLike, optional
+    :param libs_index: The names of the libraries in the libs directory, it is
+                       updated as libraries are copied. Defaults to listing the
+                       libs directory.
+    :type libs_index: set, optional
     """
-    if root is None:
-        root = libs
-    proc = subprocess.run(["ldd", path], stderr=subprocess.PIPE, stdout=subprocess.PIPE)
+    path = os.fsdecode(path)
+    libs = os.fsdecode(libs)
+    root = libs if root is None else os.fsdecode(root)
+    if libs_index is None:
+        libs_index = index_libs(libs)
+    relpart = os.path.relpath(libs, os.path.dirname(path))
+    if relpart == ".":
+        relpath = "$ORIGIN"
+    else:
+        relpath = str(pathlib.Path("$ORIGIN") / relpart)
+    needed = parse_needed_elf(path)
+    if rpath_only and needed is not None:
+        # Nothing gets copied in rpath_only mode, when the rpath is already
+        # correct or nothing can be found in libs there is no need for ldd.
+        rpath = parse_rpath(path)
+        if rpath == [relpath]:
+            log.info("Rpath of %s is already %s", path, relpath)
+            return
+        if not rpath and not any(lib_name in libs_index for lib_name in needed):
+            log.info("Do not adjust rpath of %s", path)
+            return
     needs_rpath = False
-    for line in proc.stdout.decode().splitlines():
-        if line.find("=>") == -1:
-            log.debug("Skip ldd output line: %s", line)
-            continue
-
-        lib_name, location_info = [_.strip() for _ in line.split("=>", 1)]
-        if location_info == "not found":
+    linked = None
+    if needed is not None:
+        linked = resolve_needed(needed, libs, libs_index)
+    if linked is None:
+        proc = subprocess.run(
+            ["ldd", path], stderr=subprocess.PIPE, stdout=subprocess.PIPE
+        )
+        linked = [match.groups() for match in _LDD_RE.finditer(proc.stdout.decode())]
+    for lib_name, linked_lib in linked:
+        if linked_lib == "not found":
             # It is likely that something was not compiled correctly
             log.warning("Unable to find library %s linked from %s", lib_name, path)
             continue
 
-        linked_lib = location_info.rsplit(" ", 1)[0].strip()
         lib_basename = os.path.basename(linked_lib)
 
         if lib_name in LIBCLIBS:
@@ -308,7 +763,7 @@ def handle_elf(path, libs, rpath_only, root=None):
 
         relocated_path = os.path.join(libs, lib_basename)
 
-        if os.path.exists(relocated_path):
+        if lib_basename in libs_index:
             log.debug("Relocated library exists: %s", relocated_path)
         elif rpath_only:
             log.warning("In `rpath_only mode` but %s is not in %s", linked_lib, root)
@@ -317,21 +772,40 @@ def handle_elf(path, libs, rpath_only, root=None):
             log.info("Copy %s to %s", linked_lib, relocated_path)
             shutil.copy(linked_lib, relocated_path)
             shutil.copymode(linked_lib, relocated_path)
+            libs_index.add(lib_basename)
             needs_rpath = True
 
     if needs_rpath:
-        relpart = os.path.relpath(libs, os.path.dirname(path))
-        if relpart == ".":
-            relpath = "$ORIGIN"
-        else:
-            relpath = str(pathlib.Path("$ORIGIN") / relpart)
-
         log.info("Adjust rpath of %s to %s", path, relpath)
         patch_rpath(path, relpath)
     else:
         log.info("Do not adjust rpath of %s", path)
 
 
+def walk_files(root):
+    """
+    Recursively yield the paths of the regular files under a directory.
+
+    Symlinks are not followed. ``os.scandir`` entries carry their file type
+    so no additional ``stat`` calls are needed. Directories that can not be
+    listed are skipped, like ``os.walk`` does.
+
+    :param root: The directory to traverse
+    :type root: str
+    """
+    try:
+        it = os.scandir(root)
+    except OSError as exc:
+        log.warning("Unable to list %s: %s", root, exc)
+        return
+    with it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=False):
+                yield from walk_files(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry.path
+
+
 def main(
     root, libs_dir=None, rpath_only=True, log_level="DEBUG", log_file_name="<stdout>"
 ):
@@ -364,25 +838,37 @@ def main(
         libs_dir = pathlib.Path(root_dir, "lib")
     libs_dir = str(pathlib.Path(libs_dir).resolve())
     rpath_only = rpath_only
+    # List libs_dir once, handle_elf keeps it up to date as it copies.
+    libs_index = index_libs(libs_dir)
     processed = {}
     found = True
     while found:
         found = False
-        for root, dirs, files in os.walk(root_dir):
-            for file in files:
-                path = os.path.join(root, file)
-                if path in processed:
-                    continue
-                log.debug("Checking %s", path)
-                if is_macho(path):
-                    log.info("Found Mach-O %s", path)
-                    _ = handle_macho(path, libs_dir, rpath_only)
-                    if _ is not None:
-                        processed[path] = _
-                        found = True
-                elif is_elf(path):
-                    log.info("Found ELF %s", path)
-                    handle_elf(path, libs_dir, rpath_only, root_dir)
+        elfs = []
+        for path in walk_files(root_dir):
+            if path in processed:
+                continue
+            log.debug("Checking %s", path)
+            # Read the magic once and dispatch on it rather than opening
+            # the file again for each format check.
+            magic = read_magic(path)
+            if magic in MACHO_MAGIC:
+                log.info("Found Mach-O %s", path)
+                _ = handle_macho(path, libs_dir, rpath_only)
+                if _ is not None:
+                    processed[path] = _
+                    found = True
+            elif magic == ELF_MAGIC:
+                log.info("Found ELF %s", path)
+                elfs.append(path)
+        if not elfs:
+            continue
+        cache_rpaths(elfs)
+        # Libraries copied into libs_dir are picked up by the next pass.
+        for path in elfs:
+            handle_elf(path, libs_dir, rpath_only, root_dir, libs_index)
+            processed[path] = True
+        found = True
 
 
 if __name__ == "__main__":
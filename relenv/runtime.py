@@ -17,6 +17,7 @@ import importlib
 import json
 import os
 import pathlib
+import re
 import shutil
 import site
 import subprocess
@@ -48,26 +49,33 @@ def path_import(name, path):
     return module
 
 
+# Modules loaded by the common and relocate trampolines below.
+_COMMON = None
+_RELOCATE = None
+
+
 def common():
     """
     Late import relenv common.
     """
-    if not hasattr(common, "common"):
-        common.common = path_import(
+    global _COMMON
+    if _COMMON is None:
+        _COMMON = path_import(
             "relenv.common", str(pathlib.Path(__file__).parent / "common.py")
         )
-    return common.common
+    return _COMMON
 
 
 def relocate():
     """
     Late import relenv relocate.
     """
-    if not hasattr(relocate, "relocate"):
-        relocate.relocate = path_import(
+    global _RELOCATE
+    if _RELOCATE is None:
+        _RELOCATE = path_import(
             "relenv.relocate", str(pathlib.Path(__file__).parent / "relocate.py")
         )
-    return relocate.relocate
+    return _RELOCATE
 
 
 def get_major_version():
@@ -456,16 +464,44 @@ class RelenvImporter:
         if wrappers is None:
             wrappers = []
         self.wrappers = set(wrappers)
+        # Most wrappers match a module name exactly, index those by name so
+        # the imports that are not wrapped cost a single dict lookup. Prefix
+        # wrappers that span a package boundary can only match modules in
+        # that top level package, index those by it.
+        self._exact = {}
+        self._prefixed = {}
+        self._other = []
+        for wrapper in self.wrappers:
+            if wrapper.matcher != "startswith":
+                self._exact.setdefault(wrapper.module, []).append(wrapper)
+            elif "." in wrapper.module:
+                head = wrapper.module.split(".", 1)[0]
+                self._prefixed.setdefault(head, []).append(wrapper)
+            else:
+                self._other.append(wrapper)
         if _loads is None:
             _loads = {}
         self._loads = _loads
 
+    def _matching(self, module_name):
+        """
+        Iterate the wrappers matching a module name.
+        """
+        yield from self._exact.get(module_name, ())
+        head = module_name.split(".", 1)[0]
+        for wrapper in self._prefixed.get(head, ()):
+            if wrapper.matches(module_name):
+                yield wrapper
+        for wrapper in self._other:
+            if wrapper.matches(module_name):
+                yield wrapper
+
     def find_spec(self, module_name, package_path=None, target=None):
         """
         Find modules being imported.
         """
-        for wrapper in self.wrappers:
-            if wrapper.matches(module_name) and not wrapper.loading:
+        for wrapper in self._matching(module_name):
+            if not wrapper.loading:
                 debug(f"RelenvImporter - match {module_name} {package_path} {target}")
                 wrapper.loading = True
                 return importlib.util.spec_from_loader(module_name, self)
@@ -474,8 +510,8 @@ class RelenvImporter:
         """
         Find modules being imported.
         """
-        for wrapper in self.wrappers:
-            if wrapper.matches(module_name) and not wrapper.loading:
+        for wrapper in self._matching(module_name):
+            if not wrapper.loading:
                 debug(f"RelenvImporter - match {module_name}")
                 wrapper.loading = True
                 return self
@@ -484,12 +520,11 @@ class RelenvImporter:
         """
         Load an imported module.
         """
-        for wrapper in self.wrappers:
-            if wrapper.matches(name):
-                debug(f"RelenvImporter - load_module {name}")
-                mod = wrapper(name)
-                wrapper.loading = False
-                break
+        for wrapper in self._matching(name):
+            debug(f"RelenvImporter - load_module {name}")
+            mod = wrapper(name)
+            wrapper.loading = False
+            break
         sys.modules[name] = mod
         return mod
 
@@ -839,42 +874,65 @@ def install_cargo_config():
             )
 
 
+_OPENSSL_DIR_RE = re.compile(r'^(MODULESDIR|OPENSSLDIR):\s*"([^"]+)"', re.M)
+
+
+def openssl_dirs(openssl_bin):
+    """
+    Get the system openssl's modules and configuration directories.
+
+    Both are read from a single ``openssl version -a`` invocation.
+
+    :param openssl_bin: The path to the openssl binary
+    :type openssl_bin: str
+
+    :return: A mapping of ``MODULESDIR`` and ``OPENSSLDIR`` to their paths
+    :rtype: dict
+    """
+    proc = subprocess.run(
+        [openssl_bin, "version", "-a"],
+        universal_newlines=True,
+        shell=False,
+        check=False,
+        capture_output=True,
+    )
+    if proc.returncode != 0:
+        msg = "Unable to get the directories from openssl"
+        if proc.stderr:
+            msg += f": {proc.stderr}"
+        debug(msg)
+        return {}
+    return dict(_OPENSSL_DIR_RE.findall(proc.stdout))
+
+
 def setup_openssl():
     """
     Configure openssl certificate locations.
     """
+    environ = os.environ
+    if sys.platform == "win32" or (
+        "OPENSSL_MODULES" in environ and "SSL_CERT_DIR" in environ
+    ):
+        return
+
     openssl_bin = shutil.which("openssl")
     if not openssl_bin:
         debug("Could not find the 'openssl' binary in the path")
         return
 
-    if "OPENSSL_MODULES" not in os.environ and sys.platform != "win32":
+    dirs = openssl_dirs(openssl_bin)
+
+    if "OPENSSL_MODULES" not in environ:
         # First try and load the system's fips provider. Then load relenv's
         # legacy and default providers. The fips provider must be loaded first
         # in order OpenSSl to work properly..
 
         # Try and determine the system's openssl modules directory. This is so
         # we can use the system installed fips provider if it configured.
-        proc = subprocess.run(
-            [openssl_bin, "version", "-m"],
-            universal_newlines=True,
-            shell=False,
-            check=False,
-            capture_output=True,
-        )
-        if proc.returncode != 0:
-            msg = "Unable to get the modules directory from openssl"
-            if proc.stderr:
-                msg += f": {proc.stderr}"
-            debug(msg)
+        if "MODULESDIR" not in dirs:
+            debug("Unable to get the modules directory from openssl")
         else:
-            try:
-                _, directory = proc.stdout.split(":")
-            except ValueError:
-                debug("Unable to parse modules dir")
-                return
-            path = directory.strip().strip('"')
-            set_openssl_modules_dir(path)
+            set_openssl_modules_dir(dirs["MODULESDIR"])
             if load_openssl_provider("fips") == 0:
                 debug("Unable to load the fips openssl provider")
 
@@ -888,31 +946,16 @@ def setup_openssl():
     # Use system openssl dirs
     # XXX Should we also setup SSL_CERT_FILE, OPENSSL_CONF &
     # OPENSSL_CONF_INCLUDE?
-    if "SSL_CERT_DIR" not in os.environ and sys.platform != "win32":
-        proc = subprocess.run(
-            [openssl_bin, "version", "-d"],
-            universal_newlines=True,
-            shell=False,
-            check=False,
-            capture_output=True,
-        )
-        if proc.returncode != 0:
-            msg = "Unable to get the certificates directory from openssl"
-            if proc.stderr:
-                msg += f": {proc.stderr}"
-            debug(msg)
-        else:
-            try:
-                _, directory = proc.stdout.split(":")
-            except ValueError:
-                debug("Unable to parse openssldir")
-                return
-            path = pathlib.Path(directory.strip().strip('"'))
-            if not os.environ.get("SSL_CERT_DIR"):
-                os.environ["SSL_CERT_DIR"] = str(path / "certs")
-            cert_file = path / "cert.pem"
-            if cert_file.exists() and not os.environ.get("SSL_CERT_FILE"):
-                os.environ["SSL_CERT_FILE"] = str(cert_file)
+    if "SSL_CERT_DIR" not in environ:
+        if "OPENSSLDIR" not in dirs:
+            debug("Unable to get the certificates directory from openssl")
+            return
+        path = pathlib.Path(dirs["OPENSSLDIR"])
+        if not environ.get("SSL_CERT_DIR"):
+            environ["SSL_CERT_DIR"] = str(path / "certs")
+        cert_file = path / "cert.pem"
+        if cert_file.exists() and not environ.get("SSL_CERT_FILE"):
+            environ["SSL_CERT_FILE"] = str(cert_file)
 
 
 def set_openssl_modules_dir(path):
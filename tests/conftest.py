@@ -1,11 +1,15 @@
 # Copyright 2023-2024 VMware, Inc.
 # SPDX-License-Identifier: Apache-2.0
 #
+import functools
+import io
 import logging
 import os
+import pathlib
 import platform
 import shutil
 import sys
+import tarfile
 
 import pytest
 
@@ -28,6 +32,18 @@ def get_build_version():
         return versions[0]
 
 
+@functools.lru_cache(maxsize=1)
+def check_test_environment():
+    """
+    Whether we are running on photon 4, where fips mode is enabled.
+    """
+    try:
+        release = pathlib.Path("/etc/os-release").read_bytes()
+    except OSError:
+        return False
+    return b"Photon" in release and b"4.0" in release
+
+
 def pytest_report_header(config):
     return f"relenv python version: {get_build_version()}"
 
@@ -83,3 +99,22 @@ def pyexec(build):
     if exe is None:
         pytest.fail(f"Failed to find 'python3' and 'python' in '{path}'")
     yield exe
+
+
+@pytest.fixture(scope="session")
+def fake_archive_bytes():
+    """
+    An uncompressed archive containing ``to_be_archived/testfile``.
+
+    The archive is only built once per session, tests write the bytes to
+    their own location.
+    """
+    dirinfo = tarfile.TarInfo("to_be_archived")
+    dirinfo.type = tarfile.DIRTYPE
+    dirinfo.mode = 0o755
+    fileinfo = tarfile.TarInfo("to_be_archived/testfile")
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        tar.addfile(dirinfo)
+        tar.addfile(fileinfo)
+    return buf.getvalue()
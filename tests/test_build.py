@@ -4,7 +4,14 @@ import hashlib
 
 import pytest
 
-from relenv.build.common import Builder, verify_checksum
+from relenv.build.common import (
+    CHECKSUM_BUFSIZE,
+    Builder,
+    parse_links,
+    python_version,
+    sha1_digest,
+    verify_checksum,
+)
 from relenv.common import DATA_DIR, RelenvException
 
 
@@ -43,3 +50,19 @@ def test_verify_checksum(fake_download, fake_download_md5):
 
 def test_verify_checksum_failed(fake_download):
     pytest.raises(RelenvException, verify_checksum, fake_download, "no")
+
+
+@pytest.mark.parametrize("file_digest", [True, False])
+def test_sha1_digest_spans_buffers(tmp_path, monkeypatch, file_digest):
+    if not file_digest:
+        monkeypatch.delattr(hashlib, "file_digest", raising=False)
+    data = b"relenv" * CHECKSUM_BUFSIZE
+    path = tmp_path / "large_download"
+    path.write_bytes(data)
+    assert sha1_digest(path) == hashlib.sha1(data).hexdigest()
+
+
+def test_parse_links_with_version_func():
+    text = '<a href="3.12.1/">3.12.1</a><a href="other/">other</a><a>none</a>'
+    assert parse_links(text) == ["3.12.1/", "other/"]
+    assert parse_links(text, python_version) == ["3.12.1"]
@@ -134,6 +134,42 @@ def test_get_toolchain_no_arch(tmp_path):
         assert ret == data_dir / "toolchain"
 
 
+COMPRESSORS = {
+    ":gz": ["gzip", "-c"],
+    ":xz": ["xz", "-T0", "-c"],
+    ":bz2": ["bzip2", "-c"],
+}
+
+
+def make_archive(tar_file, to_be_archived, open_arg):
+    """
+    Stream ``tar -c`` through the compressor when the tools are available.
+
+    Fall back to the ``tarfile`` module on windows or when either binary is
+    missing.
+    """
+    compressor = COMPRESSORS.get(open_arg)
+    if (
+        compressor
+        and sys.platform != "win32"
+        and shutil.which("tar")
+        and shutil.which(compressor[0])
+    ):
+        with open(tar_file, "wb") as fp:
+            tar = subprocess.Popen(
+                ["tar", "-cC", str(to_be_archived.parent), to_be_archived.name],
+                stdout=subprocess.PIPE,
+            )
+            comp = subprocess.Popen(compressor, stdin=tar.stdout, stdout=fp)
+            # Allow tar to receive a SIGPIPE if the compressor exits early.
+            tar.stdout.close()
+            assert comp.wait() == 0
+            assert tar.wait() == 0
+        return
+    with tarfile.open(str(tar_file), "w{}".format(open_arg)) as tar:
+        tar.add(str(to_be_archived), to_be_archived.name)
+
+
 @pytest.mark.parametrize("open_arg", (":gz", ":xz", ":bz2", ""))
 def test_extract_archive(tmp_path, open_arg):
     to_be_archived = tmp_path / "to_be_archived"
@@ -142,11 +178,10 @@ def test_extract_archive(tmp_path, open_arg):
     test_file.touch()
     tar_file = tmp_path / "fake_archive"
     to_dir = tmp_path / "extracted"
-    with tarfile.open(str(tar_file), "w{}".format(open_arg)) as tar:
-        tar.add(str(to_be_archived), to_be_archived.name)
+    make_archive(tar_file, to_be_archived, open_arg)
     extract_archive(str(to_dir), str(tar_file))
     assert to_dir.exists()
-    assert (to_dir / to_be_archived.name / test_file.name) in to_dir.glob("**/*")
+    assert (to_dir / to_be_archived.name / test_file.name).is_file()
 
 
 def test_get_download_location(tmp_path):
@@ -201,7 +236,7 @@ def test_relative_interpreter_scripts_not_relative_to_root():
         relative_interpreter("/tmp/relenv", "/tmp/bar/bin", "/tmp/relenv/bin/python3")
 
 
-def test_sanitize_sys_path():
+def test_sanitize_sys_path(monkeypatch):
     if sys.platform.startswith("win"):
         path_prefix = "C:\\"
         separator = "\\"
@@ -220,10 +255,13 @@ def test_sanitize_sys_path():
         f"{path_prefix}foo{separator}1",
         f"{path_prefix}bar{separator}2",
         f"{path_prefix}lib{separator}3",
+        f"{path_prefix}foo{separator}1",
+        f"{path_prefix}foo{separator}\x00",
     ]
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(python_path_entries))
     with patch.object(sys, "prefix", f"{path_prefix}foo"), patch.object(
         sys, "base_prefix", f"{path_prefix}bar"
-    ), patch.dict(os.environ, PYTHONPATH=os.pathsep.join(python_path_entries)):
+    ):
         new_sys_path = sanitize_sys_path(sys_path)
         assert new_sys_path != sys_path
         assert new_sys_path == expected
@@ -3,7 +3,6 @@
 #
 import os
 import pathlib
-import tarfile
 from unittest.mock import patch
 
 import pytest
@@ -17,28 +16,33 @@ def test_chdir(tmp_path):
         assert pathlib.Path(os.getcwd()) == tmp_path
 
 
-def test_create(tmp_path):
-    to_be_archived = tmp_path / "to_be_archived"
-    to_be_archived.mkdir()
-    test_file = to_be_archived / "testfile"
-    test_file.touch()
+@pytest.fixture
+def fake_archive(tmp_path, monkeypatch):
+    """
+    Point ``relenv.create.archived_build`` at ``tmp_path / "fake_archive"``.
+
+    The archive itself is not created.
+    """
     tar_file = tmp_path / "fake_archive"
-    with tarfile.open(str(tar_file), "w:xz") as tar:
-        tar.add(str(to_be_archived), to_be_archived.name)
+    monkeypatch.setattr(
+        "relenv.create.archived_build", lambda *args, **kwargs: tar_file
+    )
+    return tar_file
 
-    with patch("relenv.create.archived_build", return_value=tar_file):
-        create("foo", dest=tmp_path)
+
+def test_create(tmp_path, fake_archive, fake_archive_bytes):
+    fake_archive.write_bytes(fake_archive_bytes)
+
+    create("foo", dest=tmp_path)
 
     to_dir = tmp_path / "foo"
     assert (to_dir).exists()
-    assert (to_dir / to_be_archived.name / test_file.name) in to_dir.glob("**/*")
+    assert (to_dir / "to_be_archived" / "testfile").is_file()
 
 
-def test_create_tar_doesnt_exist(tmp_path):
-    tar_file = tmp_path / "fake_archive"
-    with patch("relenv.create.archived_build", return_value=tar_file):
-        with pytest.raises(CreateException):
-            create("foo", dest=tmp_path)
+def test_create_tar_doesnt_exist(tmp_path, fake_archive):
+    with pytest.raises(CreateException):
+        create("foo", dest=tmp_path)
 
 
 def test_create_directory_exists(tmp_path):
@@ -2,100 +2,75 @@
 # SPDX-License-Identifier: Apache-2
 import pathlib
 import subprocess
-import sys
 from unittest.mock import patch
 
+import pytest
+
 from relenv.build.common import Download
 from relenv.common import RelenvException
 
 
-def test_download_url():
-    download = Download(
-        "test", "https://test.com/{version}/test-{version}.tar.xz", version="1.0.0"
-    )
+@pytest.fixture
+def download_factory():
+    def _make(**overrides):
+        overrides.setdefault("version", "1.0.0")
+        return Download(
+            "test", "https://test.com/{version}/test-{version}.tar.xz", **overrides
+        )
+
+    return _make
+
+
+def test_download_url(download_factory):
+    download = download_factory()
     assert download.url == "https://test.com/1.0.0/test-1.0.0.tar.xz"
 
 
-def test_download_url_change_version():
-    download = Download(
-        "test", "https://test.com/{version}/test-{version}.tar.xz", version="1.0.0"
-    )
+def test_download_url_change_version(download_factory):
+    download = download_factory()
     download.version = "1.2.2"
     assert download.url == "https://test.com/1.2.2/test-1.2.2.tar.xz"
 
 
-def test_download_filepath():
-    download = Download(
-        "test",
-        "https://test.com/{version}/test-{version}.tar.xz",
-        version="1.0.0",
-        destination="/tmp",
-    )
+def test_download_filepath(download_factory):
+    download = download_factory(destination="/tmp")
     assert isinstance(download.filepath, pathlib.Path)
-    if sys.platform.startswith("win"):
-        assert str(download.filepath) == "\\tmp\\test-1.0.0.tar.xz"
-    else:
-        assert str(download.filepath) == "/tmp/test-1.0.0.tar.xz"
-
-
-def test_download_filepath_change_destination():
-    download = Download(
-        "test",
-        "https://test.com/{version}/test-{version}.tar.xz",
-        version="1.0.0",
-        destination="/tmp",
-    )
+    assert download.filepath == pathlib.PurePath("/tmp") / "test-1.0.0.tar.xz"
+
+
+def test_download_filepath_change_destination(download_factory):
+    download = download_factory(destination="/tmp")
     download.destination = "/tmp/foo"
     assert isinstance(download.filepath, pathlib.Path)
-    if sys.platform.startswith("win"):
-        assert str(download.filepath) == "\\tmp\\foo\\test-1.0.0.tar.xz"
-    else:
-        assert str(download.filepath) == "/tmp/foo/test-1.0.0.tar.xz"
-
-
-def test_download_exists(tmp_path):
-    download = Download(
-        "test",
-        "https://test.com/{version}/test-{version}.tar.xz",
-        version="1.0.0",
-        destination=tmp_path,
-    )
+    assert download.filepath == pathlib.PurePath("/tmp", "foo", "test-1.0.0.tar.xz")
+
+
+def test_download_exists(tmp_path, download_factory):
+    download = download_factory(destination=tmp_path)
     assert download.exists() is False
     (pathlib.Path(tmp_path) / "test-1.0.0.tar.xz").touch()
     assert download.exists() is True
 
 
-def test_validate_md5sum(tmp_path):
-    fake_md5 = "fakemd5"
-    with patch("relenv.build.common.verify_checksum") as run_mock:
-        assert Download.validate_checksum(str(tmp_path), fake_md5) is True
-        run_mock.assert_called_with(str(tmp_path), fake_md5)
-
-
-def test_validate_md5sum_failed(tmp_path):
+@pytest.mark.parametrize(
+    "side_effect,expected", [(None, True), (RelenvException, False)]
+)
+def test_validate_md5sum(tmp_path, side_effect, expected):
     fake_md5 = "fakemd5"
     with patch(
-        "relenv.build.common.verify_checksum", side_effect=RelenvException
+        "relenv.build.common.verify_checksum", side_effect=side_effect
     ) as run_mock:
-        assert Download.validate_checksum(str(tmp_path), fake_md5) is False
+        assert Download.validate_checksum(str(tmp_path), fake_md5) is expected
         run_mock.assert_called_with(str(tmp_path), fake_md5)
 
 
-def test_validate_signature(tmp_path):
-    sig = "fakesig"
-    with patch("relenv.build.common.runcmd") as run_mock:
-        assert Download.validate_signature(str(tmp_path), sig) is True
-        run_mock.assert_called_with(
-            ["gpg", "--verify", sig, str(tmp_path)],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-
-
-def test_validate_signature_failed(tmp_path):
+@pytest.mark.parametrize(
+    "side_effect,expected", [(None, True), (RelenvException, False)]
+)
+def test_validate_signature(tmp_path, side_effect, expected):
     sig = "fakesig"
-    with patch("relenv.build.common.runcmd", side_effect=RelenvException) as run_mock:
-        assert Download.validate_signature(str(tmp_path), sig) is False
+    with patch("relenv.build.common.runcmd", side_effect=side_effect) as run_mock:
+        assert Download.validate_signature(str(tmp_path), sig) is expected
         run_mock.assert_called_with(
             ["gpg", "--verify", sig, str(tmp_path)],
             stdout=subprocess.PIPE,
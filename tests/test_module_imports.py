@@ -0,0 +1,31 @@
+# Copyright 2026 VMware, Inc.
+# SPDX-License-Identifier: Apache-2.0
+#
+import importlib
+import os
+import pathlib
+
+import relenv
+
+
+def _top_level_modules():
+    relenv_dir = pathlib.Path(relenv.__file__).parent
+    with os.scandir(relenv_dir) as it:
+        names = sorted(
+            entry.name
+            for entry in it
+            if entry.is_file(follow_symlinks=False) and entry.name.endswith(".py")
+        )
+    modules = []
+    for name in names:
+        stem = name[:-3]
+        if stem == "__init__":
+            modules.append("relenv")
+        else:
+            modules.append(f"relenv.{stem}")
+    return modules
+
+
+def test_import_all_top_level_modules():
+    for module_name in _top_level_modules():
+        assert importlib.import_module(module_name).__name__ == module_name
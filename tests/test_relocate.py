@@ -1,20 +1,35 @@
 # Copyright 2022-2024 VMware, Inc.
 # SPDX-License-Identifier: Apache-2
+import os
 import pathlib
 import shutil
+import struct
+import subprocess
+import sys
 from textwrap import dedent
+from types import SimpleNamespace
 from unittest.mock import MagicMock, call, patch
 
 import pytest
 
 from relenv.relocate import (
+    DT_NEEDED,
+    DT_RPATH,
+    DT_RUNPATH,
     handle_elf,
     is_elf,
     is_in_dir,
     is_macho,
     main,
+    parse_needed_elf,
     parse_readelf_d,
+    parse_rpath,
+    parse_rpath_elf,
+    parse_rpaths,
     patch_rpath,
+    patchelf_batch,
+    patchelf_path,
+    walk_files,
 )
 
 pytestmark = [
@@ -22,6 +37,33 @@ pytestmark = [
 ]
 
 
+def build_elf(rpath=None, tag=DT_RUNPATH, needed=()):
+    # A minimal little endian 64 bit ELF image: the header, a PT_LOAD segment
+    # covering the whole file, a PT_DYNAMIC segment and the string table.
+    base = 0x400000
+    strtab_off = 64 + 2 * 56
+    strtab = b"\x00"
+    entries = [(5, base + strtab_off)]
+    for name in needed:
+        entries.append((DT_NEEDED, len(strtab)))
+        strtab += name.encode() + b"\x00"
+    if rpath is not None:
+        entries.append((tag, len(strtab)))
+        strtab += rpath.encode() + b"\x00"
+    entries.append((0, 0))
+    dynamic = b"".join(struct.pack("<qQ", *entry) for entry in entries)
+    dyn_off = strtab_off + len(strtab)
+    dyn_addr = base + dyn_off
+    size = dyn_off + len(dynamic)
+    header = b"\x7fELF\x02\x01\x01" + b"\x00" * 9
+    header += struct.pack("<HHIQQQIHHHHHH", 3, 62, 1, 0, 64, 0, 0, 64, 56, 2, 64, 0, 0)
+    phdrs = struct.pack("<IIQQQQQQ", 1, 4, 0, base, base, size, size, 0x1000)
+    phdrs += struct.pack(
+        "<IIQQQQQQ", 2, 4, dyn_off, dyn_addr, dyn_addr, len(dynamic), len(dynamic), 8
+    )
+    return header + phdrs + strtab + dynamic
+
+
 class BaseProject:
     def __init__(self, root_dir):
         self.root_dir = root_dir
@@ -31,26 +73,17 @@ class BaseProject:
         self.root_dir.mkdir(parents=True, exist_ok=True)
         self.libs_dir.mkdir(parents=True, exist_ok=True)
 
-    def destroy_project(self):
-        # Make sure the project is torn down properly
-        if pathlib.Path(self.root_dir).exists():
-            shutil.rmtree(self.root_dir, ignore_errors=True)
-
     def add_file(self, name, contents, *relpath, binary=False):
-        file_path = (self.root_dir / pathlib.Path(*relpath) / name).resolve()
-        file_path.parent.mkdir(parents=True, exist_ok=True)
-        if binary:
-            file_path.write_bytes(contents)
-        else:
-            file_path.write_text(contents)
-        return file_path
-
-    def __enter__(self):
-        self.make_project()
-        return self
-
-    def __exit__(self, *exc):
-        self.destroy_project()
+        file_path = os.path.normpath(os.path.join(str(self.root_dir), *relpath, name))
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        if not binary:
+            contents = contents.encode()
+        fd = os.open(file_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, contents)
+        finally:
+            os.close(fd)
+        return pathlib.Path(file_path)
 
 
 class LinuxProject(BaseProject):
@@ -58,9 +91,29 @@ class LinuxProject(BaseProject):
         return self.add_file(name, b"\x7f\x45\x4c\x46", *relpath, binary=True)
 
 
-def test_is_macho_true(tmp_path):
+@pytest.fixture
+def linux_project(tmp_path):
+    # Projects live under the test's tmp_path, pytest removes them.
+    def make_linux_project():
+        proj = LinuxProject(tmp_path / "proj")
+        proj.make_project()
+        return proj
+
+    return make_linux_project
+
+
+@pytest.mark.parametrize(
+    "magic",
+    [
+        b"\xcf\xfa\xed\xfe",
+        b"\xce\xfa\xed\xfe",
+        b"\xfe\xed\xfa\xcf",
+        b"\xfe\xed\xfa\xce",
+    ],
+)
+def test_is_macho_true(tmp_path, magic):
     lib_path = tmp_path / "test.dylib"
-    lib_path.write_bytes(b"\xcf\xfa\xed\xfe")
+    lib_path.write_bytes(magic)
     assert is_macho(lib_path) is True
 
 
@@ -149,6 +202,103 @@ def test_parse_readelf_d_rpath():
     assert parse_readelf_d(section) == ["$ORIGIN/../.."]
 
 
+@pytest.mark.parametrize("tag", [DT_RPATH, DT_RUNPATH])
+def test_parse_rpath_elf(tmp_path, tag):
+    path = tmp_path / "simple.so"
+    path.write_bytes(build_elf("$ORIGIN/../lib:/usr/lib", tag))
+    assert parse_rpath_elf(path) == ["$ORIGIN/../lib", "/usr/lib"]
+
+
+def test_parse_rpath_elf_no_rpath(tmp_path):
+    path = tmp_path / "simple.so"
+    path.write_bytes(build_elf())
+    assert parse_rpath_elf(path) == []
+
+
+@pytest.mark.parametrize(
+    "contents", [b"", b"fake", b"\x7f\x45\x4c\x46"], ids=["empty", "text", "magic"]
+)
+def test_parse_rpath_elf_unparsable(tmp_path, contents):
+    path = tmp_path / "not-an-so"
+    path.write_bytes(contents)
+    assert parse_rpath_elf(path) is None
+    assert parse_needed_elf(path) is None
+
+
+def test_parse_needed_elf(tmp_path):
+    path = tmp_path / "simple.so"
+    path.write_bytes(build_elf("$ORIGIN", needed=["libfoo.so.1", "libc.so.6"]))
+    assert parse_needed_elf(path) == ["libfoo.so.1", "libc.so.6"]
+    assert parse_rpath_elf(path) == ["$ORIGIN"]
+
+
+@pytest.mark.skipif(shutil.which("readelf") is None, reason="Test needs readelf")
+def test_parse_rpath_elf_matches_readelf():
+    if not is_elf(sys.executable):
+        pytest.skip("Test needs an ELF python executable")
+    proc = subprocess.run(
+        ["readelf", "-d", sys.executable], stdout=subprocess.PIPE, check=True
+    )
+    assert parse_rpath_elf(sys.executable) == parse_readelf_d(proc.stdout.decode())
+
+
+def test_parse_rpaths_batch(tmp_path):
+    simple = str(tmp_path / "simple.so")
+    simple2 = str(tmp_path / "simple2.so")
+    readelf_ret = dedent(
+        """
+    File: {simple}
+
+    Dynamic section at offset 0x58000 contains 27 entries:
+      Tag        Type                         Name/Value
+     0x000000000000000f (RPATH)              Library rpath: [$ORIGIN/../..]
+     0x0000000000000001 (NEEDED)             Shared library: [libc.so.6]
+
+    File: {simple2}
+
+    Dynamic section at offset 0xbdd40 contains 28 entries:
+      Tag        Type                         Name/Value
+     0x0000000000000001 (NEEDED)             Shared library: [libc.so.6]
+    """
+    ).format(simple=simple, simple2=simple2)
+    with patch("relenv.relocate.parse_rpath_elf", return_value=None), patch(
+        "subprocess.run", return_value=MagicMock(stdout=readelf_ret.encode())
+    ) as run_mock:
+        assert parse_rpaths([simple, simple2]) == {
+            simple: ["$ORIGIN/../.."],
+            simple2: [],
+        }
+        assert run_mock.call_count == 1
+
+
+def test_parse_rpath_memoized(tmp_path):
+    path = tmp_path / "simple.so"
+    path.write_bytes(build_elf("/tmp/relenv/build/lib"))
+    with patch("relenv.relocate._RPATH_CACHE", {}), patch(
+        "relenv.relocate.parse_rpaths", wraps=parse_rpaths
+    ) as parse_mock:
+        assert parse_rpath(path) == ["/tmp/relenv/build/lib"]
+        assert parse_rpath(path) == ["/tmp/relenv/build/lib"]
+        assert parse_mock.call_count == 1
+
+        # Patching the rpath drops the memoized value even though the file's
+        # size and mtime are unchanged, including one read while the file is
+        # being rewritten.
+        def patchelf(path, ops):
+            assert parse_rpath(path) == ["/tmp/relenv/build/lib"]
+            stat = os.stat(path)
+            pathlib.Path(path).write_bytes(
+                build_elf("$ORIGIN/../lib" + "\x00" * 7, DT_RPATH)
+            )
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            return True
+
+        with patch("relenv.relocate.patchelf_batch", side_effect=patchelf):
+            assert patch_rpath(str(path), "$ORIGIN/../lib") == "$ORIGIN/../lib"
+        assert parse_rpath(path) == ["$ORIGIN/../lib"]
+        assert parse_mock.call_count == 2
+
+
 def test_is_in_dir(tmp_path):
     parent = tmp_path / "foo"
     child = tmp_path / "foo" / "bar" / "bang"
@@ -164,7 +314,10 @@ def test_is_in_dir_false(tmp_path):
 def test_patch_rpath(tmp_path):
     path = str(tmp_path / "test")
     new_rpath = str(pathlib.Path("$ORIGIN", "..", "..", "lib"))
-    with patch("subprocess.run", return_value=MagicMock(returncode=0)):
+    with patch(
+        "subprocess.run",
+        return_value=SimpleNamespace(returncode=0, stdout=b"", stderr=b""),
+    ):
         with patch(
             "relenv.relocate.parse_rpath",
             return_value=[str(tmp_path / "old" / "lib")],
@@ -175,7 +328,10 @@ def test_patch_rpath(tmp_path):
 def test_patch_rpath_failed(tmp_path):
     path = str(tmp_path / "test")
     new_rpath = str(pathlib.Path("$ORIGIN", "..", "..", "lib"))
-    with patch("subprocess.run", return_value=MagicMock(returncode=1)):
+    with patch(
+        "subprocess.run",
+        return_value=SimpleNamespace(returncode=1, stdout=b"", stderr=b""),
+    ):
         with patch(
             "relenv.relocate.parse_rpath",
             return_value=[str(tmp_path / "old" / "lib")],
@@ -186,7 +342,10 @@ def test_patch_rpath_failed(tmp_path):
 def test_patch_rpath_no_change(tmp_path):
     path = str(tmp_path / "test")
     new_rpath = str(pathlib.Path("$ORIGIN", "..", "..", "lib"))
-    with patch("subprocess.run", return_value=MagicMock(returncode=0)):
+    with patch(
+        "subprocess.run",
+        return_value=SimpleNamespace(returncode=0, stdout=b"", stderr=b""),
+    ):
         with patch("relenv.relocate.parse_rpath", return_value=[new_rpath]):
             assert patch_rpath(path, new_rpath, only_relative=False) == new_rpath
 
@@ -194,7 +353,10 @@ def test_patch_rpath_no_change(tmp_path):
 def test_patch_rpath_remove_non_relative(tmp_path):
     path = str(tmp_path / "test")
     new_rpath = str(pathlib.Path("$ORIGIN", "..", "..", "lib"))
-    with patch("subprocess.run", return_value=MagicMock(returncode=0)):
+    with patch(
+        "subprocess.run",
+        return_value=SimpleNamespace(returncode=0, stdout=b"", stderr=b""),
+    ):
         with patch(
             "relenv.relocate.parse_rpath",
             return_value=[str(tmp_path / "old" / "lib")],
@@ -202,24 +364,119 @@ def test_patch_rpath_remove_non_relative(tmp_path):
             assert patch_rpath(path, new_rpath) == new_rpath
 
 
-def test_main_linux(tmp_path):
-    proj = LinuxProject(tmp_path)
+@pytest.mark.skip_unless_on_linux
+@pytest.mark.skip_if_binaries_missing("gcc", "nm", "patchelf")
+def test_patch_rpath_keeps_suffix_merged_symbols(tmp_path):
+    # The linker suffix-merges .dynstr, the name of the exported symbol "lib"
+    # is stored in the tail of the rpath string.
+    source = tmp_path / "libs1.c"
+    source.write_text("int lib = 1;\n")
+    path = str(tmp_path / "libs1.so")
+    subprocess.run(
+        [
+            "gcc",
+            "-shared",
+            "-fPIC",
+            "-o",
+            path,
+            str(source),
+            "-Wl,-rpath,/tmp/relenv/build/lib",
+            "-Wl,--disable-new-dtags",
+        ],
+        check=True,
+    )
+    with patch("relenv.relocate._RPATH_CACHE", {}):
+        assert patch_rpath(path, "$ORIGIN") == "$ORIGIN"
+        assert parse_rpath(path) == ["$ORIGIN"]
+    proc = subprocess.run(
+        ["nm", "-D", "--defined-only", path], stdout=subprocess.PIPE, check=True
+    )
+    assert "lib" in proc.stdout.decode().split()
+
+
+def test_patchelf_batch(tmp_path):
+    path = str(tmp_path / "test")
+    with patch("relenv.relocate._PATCHELF", "/usr/bin/patchelf"), patch(
+        "subprocess.run",
+        return_value=SimpleNamespace(returncode=0, stdout=b"", stderr=b""),
+    ) as run_mock:
+        assert patchelf_batch(
+            path,
+            [
+                ("--force-rpath",),
+                ("--set-rpath", "$ORIGIN/../lib"),
+                ("--remove-needed", "libfoo.so.1"),
+            ],
+        )
+        run_mock.assert_called_once()
+        assert run_mock.call_args[0][0] == [
+            "/usr/bin/patchelf",
+            "--force-rpath",
+            "--set-rpath",
+            "$ORIGIN/../lib",
+            "--remove-needed",
+            "libfoo.so.1",
+            path,
+        ]
+
+
+@pytest.mark.parametrize(
+    "found,expected", [("/usr/bin/patchelf", "/usr/bin/patchelf"), (None, "patchelf")]
+)
+def test_patchelf_path(found, expected):
+    with patch("relenv.relocate._PATCHELF", None), patch(
+        "shutil.which", return_value=found
+    ) as which_mock:
+        assert patchelf_path() == expected
+        assert patchelf_path() == expected
+        assert which_mock.call_count == (1 if found else 2)
+
+
+def test_main_linux(linux_project):
+    proj = linux_project()
     simple = proj.add_simple_elf("simple.so", "foo", "bar")
     simple2 = proj.add_simple_elf("simple2.so", "foo", "bar", "bop")
     proj.add_file("not-an-so", "fake", "foo", "bar", "bop")
     calls = [
-        call(str(simple), str(proj.libs_dir), True, str(proj.root_dir)),
-        call(str(simple2), str(proj.libs_dir), True, str(proj.root_dir)),
+        call(str(simple), str(proj.libs_dir), True, str(proj.root_dir), set()),
+        call(str(simple2), str(proj.libs_dir), True, str(proj.root_dir), set()),
     ]
-    with proj:
-        with patch("relenv.relocate.handle_elf") as elf_mock:
-            main(proj.root_dir, proj.libs_dir)
-            assert elf_mock.call_count == 2
-            elf_mock.assert_has_calls(calls, any_order=True)
-
-
-def test_handle_elf(tmp_path):
-    proj = LinuxProject(tmp_path / "proj")
+    with patch("relenv.relocate.handle_elf") as elf_mock, patch(
+        "relenv.relocate._RPATH_CACHE", {}
+    ), patch("relenv.relocate.parse_rpaths", wraps=parse_rpaths) as rpaths_mock:
+        main(proj.root_dir, proj.libs_dir)
+        assert elf_mock.call_count == 2
+        elf_mock.assert_has_calls(calls, any_order=True)
+        # The rpaths of all ELF files found in a pass are read together
+        rpaths_mock.assert_called_once()
+        assert set(rpaths_mock.call_args[0][0]) == {str(simple), str(simple2)}
+
+
+def test_walk_files_skips_symlinks(linux_project):
+    proj = linux_project()
+    simple = proj.add_simple_elf("simple.so.1", "foo", "bar")
+    (simple.parent / "simple.so").symlink_to(simple)
+    assert list(walk_files(str(proj.root_dir))) == [str(simple)]
+
+
+def test_walk_files_skips_unreadable_dirs(linux_project):
+    proj = linux_project()
+    simple = proj.add_simple_elf("simple.so", "foo")
+    proj.add_simple_elf("hidden.so", "private", "bar")
+    private = str(proj.root_dir / "private")
+    scandir = os.scandir
+
+    def fake_scandir(path):
+        if path == private:
+            raise PermissionError(13, "Permission denied", path)
+        return scandir(path)
+
+    with patch("os.scandir", side_effect=fake_scandir):
+        assert list(walk_files(str(proj.root_dir))) == [str(simple)]
+
+
+def test_handle_elf(tmp_path, linux_project):
+    proj = linux_project()
     pybin = proj.add_simple_elf("python", "foo")
     libcrypt = tmp_path / "libcrypt.so.2"
     libcrypt.touch()
@@ -233,20 +490,27 @@ def test_handle_elf(tmp_path):
         libcrypt=libcrypt
     ).encode()
 
-    with proj:
-        with patch("subprocess.run", return_value=MagicMock(stdout=ldd_ret)):
-            with patch("relenv.relocate.patch_rpath") as patch_rpath_mock:
-                handle_elf(str(pybin), str(proj.libs_dir), False, str(proj.root_dir))
-                assert not (proj.libs_dir / "linux-vdso.so.1").exists()
-                assert (proj.libs_dir / "libcrypt.so.2").exists()
-                assert not (proj.libs_dir / "libm.so.6").exists()
-                assert not (proj.libs_dir / "libc.so.6").exists()
-                assert patch_rpath_mock.call_count == 1
-                patch_rpath_mock.assert_called_with(str(pybin), "$ORIGIN/../lib")
-
-
-def test_handle_elf_rpath_only(tmp_path):
-    proj = LinuxProject(tmp_path / "proj")
+    with patch("subprocess.run", return_value=SimpleNamespace(stdout=ldd_ret)):
+        with patch("relenv.relocate.patch_rpath") as patch_rpath_mock:
+            libs_index = set()
+            handle_elf(
+                str(pybin),
+                str(proj.libs_dir),
+                False,
+                str(proj.root_dir),
+                libs_index,
+            )
+            assert not (proj.libs_dir / "linux-vdso.so.1").exists()
+            assert (proj.libs_dir / "libcrypt.so.2").exists()
+            assert libs_index == {"libcrypt.so.2"}
+            assert not (proj.libs_dir / "libm.so.6").exists()
+            assert not (proj.libs_dir / "libc.so.6").exists()
+            assert patch_rpath_mock.call_count == 1
+            patch_rpath_mock.assert_called_with(str(pybin), "$ORIGIN/../lib")
+
+
+def test_handle_elf_rpath_only(tmp_path, linux_project):
+    proj = linux_project()
     pybin = proj.add_simple_elf("python", "foo")
     libcrypt = proj.libs_dir / "libcrypt.so.2"
     fake = tmp_path / "fake.so.2"
@@ -262,11 +526,36 @@ def test_handle_elf_rpath_only(tmp_path):
         libcrypt=libcrypt, fake=fake
     ).encode()
 
-    with proj:
-        libcrypt.touch()
-        with patch("subprocess.run", return_value=MagicMock(stdout=ldd_ret)):
-            with patch("relenv.relocate.patch_rpath") as patch_rpath_mock:
-                handle_elf(str(pybin), str(proj.libs_dir), True, str(proj.root_dir))
-                assert not (proj.libs_dir / "fake.so.2").exists()
-                assert patch_rpath_mock.call_count == 1
-                patch_rpath_mock.assert_called_with(str(pybin), "$ORIGIN/../lib")
+    libcrypt.touch()
+    with patch("subprocess.run", return_value=SimpleNamespace(stdout=ldd_ret)):
+        with patch("relenv.relocate.patch_rpath") as patch_rpath_mock:
+            handle_elf(str(pybin), str(proj.libs_dir), True, str(proj.root_dir))
+            assert not (proj.libs_dir / "fake.so.2").exists()
+            assert patch_rpath_mock.call_count == 1
+            patch_rpath_mock.assert_called_with(str(pybin), "$ORIGIN/../lib")
+
+
+def test_handle_elf_without_ldd(tmp_path, linux_project):
+    proj = linux_project()
+    pybin = proj.add_file(
+        "python", build_elf(needed=["libcrypt.so.2", "libc.so.6"]), "bin", binary=True
+    )
+    (proj.libs_dir / "libcrypt.so.2").touch()
+    with patch("subprocess.run") as run_mock:
+        with patch("relenv.relocate.patch_rpath") as patch_rpath_mock:
+            handle_elf(pybin, proj.libs_dir, True, proj.root_dir)
+            run_mock.assert_not_called()
+            patch_rpath_mock.assert_called_once_with(str(pybin), "$ORIGIN/../lib")
+
+
+@pytest.mark.parametrize("rpath", ["$ORIGIN/../lib", None])
+def test_handle_elf_rpath_only_skips_ldd(linux_project, rpath):
+    proj = linux_project()
+    pybin = proj.add_file(
+        "python", build_elf(rpath, needed=["libfoo.so.1"]), "bin", binary=True
+    )
+    with patch("relenv.relocate._RPATH_CACHE", {}), patch("subprocess.run") as run_mock:
+        with patch("relenv.relocate.patch_rpath") as patch_rpath_mock:
+            handle_elf(pybin, proj.libs_dir, True, proj.root_dir)
+            run_mock.assert_not_called()
+            patch_rpath_mock.assert_not_called()
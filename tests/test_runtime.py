@@ -4,24 +4,144 @@
 import importlib
 import sys
 
-import relenv.runtime
+import pytest
 
+from relenv import runtime as rt
 
-def test_importer():
+
+@pytest.fixture(autouse=True)
+def _reset_system_config_vars(monkeypatch):
+    # system_sysconfig() memoizes in a module global, start each test clean.
+    monkeypatch.setattr(rt, "_SYSTEM_CONFIG_VARS", None)
+
+
+def test_importer(monkeypatch):
     def mywrapper(name):
         mod = importlib.import_module(name)
         mod.__test_case__ = True
         return mod
 
-    importer = relenv.runtime.RelenvImporter(
+    importer = rt.RelenvImporter(
         wrappers=[
-            relenv.runtime.Wrapper("pip._internal.locations", mywrapper),
+            rt.Wrapper("pip._internal.locations", mywrapper),
         ]
     )
 
-    sys.meta_path = [importer] + sys.meta_path
+    monkeypatch.setattr(sys, "meta_path", [importer] + sys.meta_path)
 
     import pip._internal.locations
 
     assert hasattr(pip._internal.locations, "__test_case__")
     assert pip._internal.locations.__test_case__ is True
+
+
+@pytest.mark.parametrize(
+    "name,matched",
+    [
+        ("foo", False),
+        ("foo.bar", True),
+        ("baz.qux", True),
+        ("bazooka", True),
+        ("spam", False),
+        ("spam.eggs.ham", True),
+    ],
+)
+def test_importer_find_spec_matchers(name, matched):
+    importer = rt.RelenvImporter(
+        wrappers=[
+            rt.Wrapper("foo.bar", lambda name: None),
+            rt.Wrapper("baz", lambda name: None, matcher="startswith"),
+            rt.Wrapper("spam.eggs", lambda name: None, matcher="startswith"),
+        ]
+    )
+    spec = importer.find_spec(name)
+    if matched:
+        assert spec.name == name
+    else:
+        assert spec is None
+
+
+def test_importer_defaults():
+    importer = rt.RelenvImporter()
+    assert importer.wrappers == set()
+    assert importer.find_spec("foo") is None
+
+
+@pytest.mark.parametrize(
+    "name,sentinel", [("common", "_COMMON"), ("relocate", "_RELOCATE")]
+)
+def test_trampolines_cached(monkeypatch, name, sentinel):
+    calls = []
+
+    def path_import(*args):
+        calls.append(args)
+        return object()
+
+    monkeypatch.setattr(rt, sentinel, None)
+    monkeypatch.setattr(rt, "path_import", path_import)
+    trampoline = getattr(rt, name)
+    assert trampoline() is trampoline()
+    assert len(calls) == 1
+
+
+OPENSSL_VERSION_ALL = """OpenSSL 3.0.17 1 Jul 2025 (Library: OpenSSL 3.0.17 1 Jul 2025)
+OPENSSLDIR: "{openssldir}"
+ENGINESDIR: "/usr/lib/engines-3"
+MODULESDIR: "/usr/lib/ossl-modules"
+"""
+
+
+def test_openssl_dirs(monkeypatch):
+    calls = []
+
+    def run(args, **kwargs):
+        calls.append(args)
+        return rt.subprocess.CompletedProcess(
+            args, 0, OPENSSL_VERSION_ALL.format(openssldir="/usr/lib/ssl"), ""
+        )
+
+    monkeypatch.setattr(rt.subprocess, "run", run)
+    assert rt.openssl_dirs("/usr/bin/openssl") == {
+        "OPENSSLDIR": "/usr/lib/ssl",
+        "MODULESDIR": "/usr/lib/ossl-modules",
+    }
+    assert calls == [["/usr/bin/openssl", "version", "-a"]]
+
+
+def test_openssl_dirs_failure(monkeypatch):
+    monkeypatch.setattr(
+        rt.subprocess,
+        "run",
+        lambda args, **kwargs: rt.subprocess.CompletedProcess(args, 1, "", "boom"),
+    )
+    assert rt.openssl_dirs("/usr/bin/openssl") == {}
+
+
+def test_setup_openssl_cert_dir(monkeypatch, tmp_path):
+    calls = []
+
+    def run(args, **kwargs):
+        calls.append(args)
+        return rt.subprocess.CompletedProcess(
+            args, 0, OPENSSL_VERSION_ALL.format(openssldir=tmp_path), ""
+        )
+
+    (tmp_path / "cert.pem").touch()
+    monkeypatch.setattr(sys, "platform", "linux")
+    monkeypatch.setattr(rt.shutil, "which", lambda name: "/usr/bin/openssl")
+    monkeypatch.setattr(rt.subprocess, "run", run)
+    monkeypatch.setenv("OPENSSL_MODULES", "/modules")
+    monkeypatch.delenv("SSL_CERT_DIR", raising=False)
+    monkeypatch.delenv("SSL_CERT_FILE", raising=False)
+    rt.setup_openssl()
+    assert len(calls) == 1
+    assert rt.os.environ["SSL_CERT_DIR"] == str(tmp_path / "certs")
+    assert rt.os.environ["SSL_CERT_FILE"] == str(tmp_path / "cert.pem")
+
+
+def test_setup_openssl_windows(monkeypatch):
+    monkeypatch.setattr(sys, "platform", "win32")
+    monkeypatch.setattr(rt.shutil, "which", None)
+    monkeypatch.delenv("SSL_CERT_DIR", raising=False)
+    rt.setup_openssl()
+    assert "SSL_CERT_DIR" not in rt.os.environ